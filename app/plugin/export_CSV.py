@@ -1,12 +1,17 @@
 # Created by Sanshiro Enomoto on 28 December 2024 #
 
 
-import datetime, copy, logging
+import time, datetime, logging
 
 import slowapi
 from sd_component import ComponentPlugin
 
 
+def _to_csv_cell(value):
+    # one shared converter so the column fill is a single map() pass
+    return b'null' if value is None else str(value).encode()
+
+
 class Export_CSV(ComponentPlugin):
     def __init__(self, app, project, params):
         super().__init__(app, project, params)
@@ -15,7 +20,7 @@ class Export_CSV(ComponentPlugin):
     @slowapi.get('/export/csv/{channels}')
     def export_csv(self, channels:str, opts:dict, timezone:str='local', resample:float=0):
         data_path = ['data', channels]
-        data_opts = copy.deepcopy(opts)
+        data_opts = dict(opts)  # opts is a flat str-to-str dict from the URL query
         if len(timezone) == 0:
             timezone = 'local'
         if resample < 0:  # replace "no resampling" with "auto resampling"
@@ -28,31 +33,63 @@ class Export_CSV(ComponentPlugin):
         if timeseries is None:
             return None
 
-        table = [ ['DateTime', 'TimeStamp'] ]
-        table[0].extend(timeseries.keys())
+        # timezone offset is constant over the export: compute it once, not per row
+        if timezone.upper() == 'LOCAL':
+            tz_offset_sec = int(datetime.datetime.now().astimezone().utcoffset().total_seconds())
+            tz_suffix = '%s%02d:%02d' % (
+                '+' if tz_offset_sec >= 0 else '-',
+                abs(tz_offset_sec) // 3600, (abs(tz_offset_sec) % 3600) // 60
+            )
+        else:
+            tz_offset_sec = 0
+            tz_suffix = '+00:00'
+
+        # column-wise (SoA) assembly: pre-sized list per column, filled in bulk, transposed once at the end
+        nrows = max((len(data.get('t', [])) for data in timeseries.values()), default=0)
+        datetime_col = [ None ] * nrows
+        ts_col = [ None ] * nrows
+        channel_cols = []
+
+        last_day, date_prefix = None, None
+
         for name, data in timeseries.items():
             start = data.get('start', 0)
             tk = data.get('t', [])
             xk = data.get('x', [])
             for k in range(len(tk)):
-                if len(table) <= k+1:
+                if ts_col[k] is None:
                     t = int(10*(start+tk[k]))/10.0
-                    date_local = datetime.datetime.fromtimestamp(t)
-                    date_utc = datetime.datetime.utcfromtimestamp(t)
-                    if timezone.upper() == 'LOCAL':
-                        date = date_local
-                        timediff = abs((date_local - date_utc).total_seconds())
-                        tz = '+' if date_local > date_utc else '-'
-                        tz = tz + '%02d:%02d' % (int(timediff/3600), int(timediff%3600))
-                    else:
-                        date = date_utc
-                        tz = '+00:00'
-                        
-                    table.append([ date.strftime('%Y-%m-%dT%H:%M:%S') + tz, '%d' % t ])
-                table[k+1].append(str(xk[k]) if xk[k] is not None else 'null')
-
-        content = '\n'.join([
-            ','.join(['NaN' if col is None else col for col in row]) for row in table
-        ]).encode()
-                
-        return slowapi.Response(content_type='text/csv', content=content)
+                    t_local = int(t) + tz_offset_sec
+                    # date part changes at most once a day: reformat only the time part per row
+                    day = t_local // 86400
+                    if day != last_day:
+                        tm = time.gmtime(t_local)
+                        date_prefix = '%04d-%02d-%02dT' % (tm.tm_year, tm.tm_mon, tm.tm_mday)
+                        last_day = day
+                    sec = t_local % 86400
+                    datetime_col[k] = (date_prefix + '%02d:%02d:%02d%s' % (
+                        sec // 3600, (sec % 3600) // 60, sec % 60, tz_suffix
+                    )).encode('ascii')
+                    ts_col[k] = b'%d' % t
+            col = [ b'null' ] * nrows
+            col[:len(xk)] = list(map(_to_csv_cell, xk))
+            channel_cols.append(col)
+
+        # cells are stored as bytes ('null' for missing values): the output chunks are
+        # joined at the bytes level, with no whole-document encode pass at the end.
+        # streaming in row batches keeps the response memory bounded and sends the
+        # first bytes immediately
+        header = ','.join(['DateTime', 'TimeStamp'] + list(timeseries.keys())).encode()
+
+        def generate(batch_size=4096):
+            yield header
+            batch = []
+            for row in zip(datetime_col, ts_col, *channel_cols):
+                batch.append(b','.join(row))
+                if len(batch) >= batch_size:
+                    yield b'\n' + b'\n'.join(batch)
+                    batch = []
+            if len(batch) > 0:
+                yield b'\n' + b'\n'.join(batch)
+
+        return slowapi.StreamingResponse(generate(), content_type='text/csv')
@@ -1,7 +1,7 @@
 
 from .model import JSON, DictJSON
 from .request import Request
-from .response import Response, FileResponse
+from .response import Response, FileResponse, StreamingResponse
 from .router import Router, get, post, delete, route, websocket
 from .websocket import WebSocket, ConnectionClosed
 from .middleware import BasicAuthentication, FileServer
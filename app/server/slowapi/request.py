@@ -1,24 +1,55 @@
 # Created by Sanshiro Enomoto on 11 January 2025 #
 
-import copy, logging
+import sys, copy, logging
 from urllib.parse import urlparse, parse_qsl, unquote
 
 
 class Request:
     is_async = True  # True for ASGI; WSGI will change this directly
-    
+
     def __init__(self, url, method="GET", *, headers={}, body=None):
-        self.method = method.upper()
+        self.method = sys.intern(method.upper())  # interned so method comparisons reduce to pointer equality
         self.headers = copy.deepcopy(headers)
         self.body = body
 
         self.aborted = False
+        self._json_cache = {}  # parsed body per JSON/DictJSON type; shared by all matched handlers
 
         u = urlparse(url)
         self.path = [ unquote(p) for p in u.path.split('/') ]
         self.query = { unquote(key): unquote(value) for key, value in parse_qsl(u.query) }
         while self.path.count(''):
             self.path.remove('')
+        self.path = self._intern_path_segments(self.path)
+
+
+    @classmethod
+    def from_wsgi(cls, path, query_string, method='GET', *, headers={}, body=None):
+        """fast-path constructor for WSGI, where PATH_INFO and QUERY_STRING arrive already separated:
+           splits the path directly and skips the urlparse() of a reconstructed URL
+        """
+        self = cls.__new__(cls)
+        self.method = sys.intern(method.upper())
+        self.headers = copy.deepcopy(headers)
+        self.body = body
+
+        self.aborted = False
+        self._json_cache = {}
+
+        self.path = self._intern_path_segments([ unquote(p) for p in path.split('/') if len(p) > 0 ])
+        if len(query_string) > 0:
+            self.query = { unquote(key): unquote(value) for key, value in parse_qsl(query_string) }
+        else:
+            self.query = {}
+
+        return self
+
+
+    @staticmethod
+    def _intern_path_segments(path_list):
+        # interned segments compare against the (also interned) PathRule segments
+        # by pointer equality instead of character-by-character
+        return [ sys.intern(p) for p in path_list ]
 
 
     def abort(self):
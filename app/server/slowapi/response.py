@@ -1,10 +1,44 @@
 # Created by Sanshiro Enomoto on 10 January 2025 #
 
 
-import sys, os, copy, json, asyncio, logging
+import sys, os, copy, json, asyncio, threading, logging
 from decimal import Decimal
 
 
+# opt-in reuse of a thread-local Response as the dispatch seed, to reduce allocator/GC
+# pressure under high request rates. Off by default: the pooled object must be fully
+# consumed before the same thread starts the next request, which holds for synchronous
+# WSGI serving but is not guaranteed for interleaved async dispatch.
+use_response_pool = False
+
+_response_pool = threading.local()
+
+
+def get_pooled_response():
+    """returns a reset Response from the thread-local pool if the pool is enabled, else a new one
+    """
+    if not use_response_pool:
+        return Response()
+    stack = getattr(_response_pool, 'stack', None)
+    if stack:
+        return stack.pop().reset()
+    return Response()
+
+
+def release_pooled_response(response):
+    """returns a fully-consumed Response to the thread-local pool
+    Note:
+      - call only after the content has been serialized; the caller must not keep a reference
+    """
+    if not use_response_pool or type(response) is not Response:
+        return
+    stack = getattr(_response_pool, 'stack', None)
+    if stack is None:
+        stack = _response_pool.stack = []
+    if len(stack) < 4:
+        stack.append(response)
+
+
 class Response:
     status = {
         200: 'OK', 201: 'Created',
@@ -26,7 +60,8 @@ class Response:
         self.content_type = content_type
         self.content = None
         self.headers = {}
-        
+        self.terminal = False  # if True, no further handlers/sub-apps are consulted for this request
+
         if content is not None:
             if status_code == 0:
                 self.status_code = 200
@@ -37,6 +72,17 @@ class Response:
                 self.content = content
 
 
+    def reset(self):
+        """re-initializes the response for reuse (see get_pooled_response())
+        """
+        self.status_code = 0
+        self.content_type = None
+        self.content = None
+        self.headers = {}
+        self.terminal = False
+        return self
+
+
     def merge_response(self, response) -> None:
         """Merges a response into "self".
            This method can be overriden, especially by a custom Response from a "middleware" App.
@@ -47,6 +93,8 @@ class Response:
             - If status_code is different, take the content with a larger status code
             - For equal status_code, self.append() the response content
         """
+        self.terminal = self.terminal or response.terminal
+
         if self.status_code < response.status_code:
             self.status_code = response.status_code
             self.content_type = response.content_type
@@ -55,6 +103,10 @@ class Response:
         
         elif self.status_code == response.status_code:
             self.merge_content(response.content)
+            if self.content_type is None:
+                # merge_content() infers the type only for list/dict/str contents;
+                # for anything else (e.g. bytes) take it from the merged response
+                self.content_type = response.content_type
             self.headers.update(response.headers)
 
             
@@ -161,6 +213,41 @@ class Response:
 
 
 
+class StreamingResponse(Response):
+    """SlowAPI Response whose content is produced incrementally by an iterator of bytes chunks
+    Note:
+      - Chunks are written to the client as they are produced, so the memory use stays
+        bounded and the first byte goes out before the full content is materialized.
+      - A streaming response is terminal: it is not merged with other responses.
+    """
+
+    def __init__(self, chunks, *, content_type=None, status_code=200):
+        """
+        Args:
+          - chunks: an iterator/generator of bytes
+          - content_type: value for the Content-Type header
+          - status_code: status code for success
+        """
+        super().__init__(status_code, content_type=content_type)
+        self.chunks = chunks
+        self.terminal = True
+
+
+    def get_chunks(self):
+        return self.chunks
+
+
+    def get_content(self, json_kwargs={}) -> bytes:
+        # for non-streaming consumers (direct dispatch, tests): drains the iterator
+        return b''.join(self.get_chunks())
+
+
+    def __str__(self):
+        # do not drain the chunk iterator just for a log line
+        return f'[Streaming Response ({self.content_type})]'
+
+
+
 class FileResponse(Response):
     """SlowAPI Response that returns the content of a file
     Note:
@@ -1,20 +1,35 @@
 # Created by Sanshiro Enomoto on 10 January 2025 #
 
 
-import sys, typing, inspect, copy, asyncio, logging
+import sys, typing, inspect, functools, asyncio, logging
 from urllib.parse import urlparse, parse_qsl, unquote
 
 from .model import JSON, DictJSON
 from .request import Request
-from .response import Response
+from .response import Response, StreamingResponse, get_pooled_response
 from .websocket import WebSocket, ConnectionClosed
 
 
+# parameter-plan tags: how each handler argument is filled at match time
+_TAG_PARAM, _TAG_REQUEST, _TAG_BYTES, _TAG_JSON, _TAG_PATH, _TAG_QUERY = range(6)
+
+# shared return value for matched zero-argument handlers; callers must not mutate it
+_EMPTY_KWARGS = {}
+
+_INCOMPATIBLE_PARAM_FORMAT = 'SlowAPI: incompatible parameter type: %s: %s'
+
+
+@functools.lru_cache(maxsize=None)
+def _signature_of(func):
+    return inspect.signature(func)
+
+
 class PathRule:
-    def __init__(self, rule:str, method:str, func_signature:inspect.Signature, *, status_code:int=200):
+    def __init__(self, rule:str, method:str, func_signature:inspect.Signature, *, status_code:int=200, terminal:bool=False):
         self.rule_str = rule
-        self.method = method.upper()
+        self.method = sys.intern(method.upper())  # interned, as in Request: '==' hits the pointer-equality shortcut
         self.status_code = status_code
+        self.terminal = terminal
         
         self.path = []
         self.path_params = {}  # {pos:int, name:str}
@@ -42,26 +57,64 @@ class PathRule:
                 self.path_params[pos] = elem[1:-1]
                 self.path[pos] = None
 
+        # precomputed tables for match(): static rules are compared as one tuple,
+        # dynamic rules iterate only over the positions that actually need a check
+        # (the path is frozen as a tuple: no further mutation, and faster iteration;
+        # segments are interned so comparisons against the interned request segments
+        # reduce to pointer equality)
+        self.path = self.static_path = tuple(
+            sys.intern(p) if p is not None else None for p in self.path
+        )
+        self.path_len = len(self.path)
+        self.has_wild = any(p is None for p in self.path)
+        self.path_params_items = tuple(self.path_params.items())
+        self.static_path_items = tuple(
+            (pos, elem) for pos, elem in enumerate(self.path) if elem is not None
+        )
+
+        # flat argument plan: (name, converter, default, tag), dispatched on the int tag in match();
+        # the converter is resolved here so match() never touches inspect.Parameter attributes
+        self._param_plan = []
+
         for index, pname in enumerate(func_signature.parameters):
             if index == 0:  # self
                 continue
             param = func_signature.parameters[pname]
             if param.annotation is Request:   # to store request itself
                 self.request_param = pname
+                self._param_plan.append((pname, None, None, _TAG_REQUEST))
             elif param.annotation is bytes:   # to store request body
                 self.bytes_body_param = pname
+                self._param_plan.append((pname, None, None, _TAG_BYTES))
             elif param.annotation is JSON:   # to decode request body as JSON
                 self.json_body_param = pname
+                self._param_plan.append((pname, JSON, None, _TAG_JSON))
             elif param.annotation is DictJSON:   # to decode request body as dict in JSON
                 self.json_dict_body_param = pname
+                self._param_plan.append((pname, DictJSON, None, _TAG_JSON))
             elif param.annotation is WebSocket:   # for websocket; to receive WebSocket connection
                 self.websocket_param = pname
             elif param.annotation is list:  # to store URL path
                 self.path_param = pname
+                self._param_plan.append((pname, None, None, _TAG_PATH))
             elif param.annotation is dict:  # to store URL query
                 self.query_param = pname
+                self._param_plan.append((pname, None, None, _TAG_QUERY))
             else:
                 self.param_attributes[pname] = param
+                converter = param.annotation if param.annotation is not inspect._empty else None
+                default = param.default if param.default is not inspect._empty else None
+                self._param_plan.append((pname, converter, default, _TAG_PARAM))
+
+        # rule discriminators packed for a one-shot comparison in match()
+        self._sig = (self.method, self.path_len)
+
+        # a zero-argument handler needs no params/kwargs dicts at all
+        # (websocket handlers are excluded: Router.websocket() inserts into the returned dict)
+        self._no_args = (len(self._param_plan) == 0) and (self.websocket_param is None)
+
+        # specialized match function for this rule's exact shape (None if not specializable)
+        self._compiled_match = self._compile_match()
 
         if self.method == 'WEBSOCKET':
             if self.websocket_param is None:
@@ -71,127 +124,184 @@ class PathRule:
                 logging.error('SlowAPI_PathRule: WebSocket arg for non-websocket handler')
 
 
+    def _compile_match(self):
+        """generates a match function specialized to this rule's shape via exec():
+           method, path length and literal segments are hard-coded as straight-line guards,
+           replacing the generic per-rule interpretation in match().
+           Rules taking an extra path or admitting shorter requests (trailing parameters
+           with possible defaults) are not specialized and use the generic path.
+        """
+        if self.take_extra_path or (self.path_len > 0 and self.path[-1] is None):
+            return None
+
+        lines = [ 'def _match(request):' ]
+        lines += [ '    if request.aborted:', '        return None' ]
+        if self.method == '*':
+            lines += [ "    if request.method == 'WEBSOCKET':", '        return None' ]
+        else:
+            lines += [ f'    if request.method != {self.method!r}:', '        return None' ]
+        lines += [ '    p = request.path', f'    if len(p) != {self.path_len}:', '        return None' ]
+        for pos, elem in self.static_path_items:
+            lines += [ f'    if p[{pos}] != {elem!r}:', '        return None' ]
+        if self._no_args:
+            lines += [ '    return _EMPTY_KWARGS' ]
+        else:
+            captures = ', '.join(f'{name!r}: p[{pos}]' for pos, name in self.path_params_items)
+            lines += [
+                '    params = {%s}' % captures,
+                '    params.update(request.query)',
+                '    return _build_kwargs(request, params)',
+            ]
+
+        self._compiled_source = '\n'.join(lines)   # kept for debuggability
+        namespace = { '_build_kwargs': self._build_kwargs, '_EMPTY_KWARGS': _EMPTY_KWARGS }
+        exec(self._compiled_source, namespace)
+        return namespace['_match']
+
+
     def match(self, request:Request):
+        if self._compiled_match is not None:
+            return self._compiled_match(request)
+
         # do not process aborted requests
         if request.aborted:
             return None
-        
-        # method match
-        if (request.method != self.method) and ((self.method != '*') or (request.method == 'WEBSOCKET')):
-            return None
-        
-        # length match
-        if len(request.path) != len(self.path):
-            if (len(request.path) > len(self.path)) and not self.take_extra_path:
+
+        # method and length match in one tuple comparison; an exact (method, length) match
+        # is acceptable for any rule, so only mismatches need the individual checks
+        # ('*' method, extra path, shorter path with defaults)
+        if (request.method, len(request.path)) != self._sig:
+            # method match
+            if (request.method != self.method) and ((self.method != '*') or (request.method == 'WEBSOCKET')):
                 return None
-            # shorter path: maybe a parameter with a default value; check it
-            for k in range(len(request.path), len(self.path)):
-                if self.path[k] is not None:
+            # length match
+            if len(request.path) != self.path_len:
+                if (len(request.path) > self.path_len) and not self.take_extra_path:
                     return None
-        
-        # path name/param match
-        params = {}
-        for pos, value in enumerate(request.path):
-            if pos >= len(self.path):
-                pass
-            elif self.path[pos] is None:
-                params[self.path_params[pos]] = value
-            elif self.path[pos] == value:
-                pass
-            else:
+                # shorter path: maybe a parameter with a default value; check it
+                for k in range(len(request.path), self.path_len):
+                    if self.path[k] is not None:
+                        return None
+
+        # fully static rule: one tuple comparison instead of a per-segment loop
+        if not self.has_wild and not self.take_extra_path:
+            if tuple(request.path) != self.static_path:
                 return None
+            if self._no_args:
+                return _EMPTY_KWARGS
+            params = dict(request.query)
+
+        else:
+            # path name/param match
+            for pos, elem in self.static_path_items:
+                if pos < len(request.path) and request.path[pos] != elem:
+                    return None
+            if self._no_args:
+                return _EMPTY_KWARGS
+            params = {}
+            for pos, name in self.path_params_items:
+                if pos < len(request.path):
+                    params[name] = request.path[pos]
+
+            params.update(request.query)
 
-        params.update(request.query)
+        return self._build_kwargs(request, params)
 
-        # argument match / import
+
+    def _build_kwargs(self, request:Request, params:dict):
+        # argument match / import, following the plan built at decoration time
         kwargs = {}
-        for pname, attr in self.param_attributes.items():
-            value = params.get(pname, None)
-            if value is None and attr.default is not inspect._empty:
-                value = attr.default
-            if value is not None and attr.annotation is not inspect._empty:
-                try:
-                    # BUG: this does not work if the type is "Optional[xxx]"
-                    value = attr.annotation(value)
-                except Exception as e:
-                    logging.warning(f'SlowAPI: incompatible parameter type: {pname}: {e}')
+        for pname, converter, default, tag in self._param_plan:
+            if tag == _TAG_PARAM:
+                value = params.get(pname, None)
+                if value is None:
+                    value = default
+                # skip the conversion (and its try/except) when the value already has the target type,
+                # which is the common case for typed default values
+                if value is not None and converter is not None and type(value) is not converter:
+                    try:
+                        # BUG: this does not work if the type is "Optional[xxx]"
+                        value = converter(value)
+                    except (ValueError, TypeError) as e:
+                        logging.warning(_INCOMPATIBLE_PARAM_FORMAT % (pname, e))
+                        return None
+                kwargs[pname] = value
+            elif tag == _TAG_REQUEST:
+                kwargs[pname] = request
+            elif tag == _TAG_BYTES:
+                kwargs[pname] = request.body
+            elif tag == _TAG_JSON:
+                if not request.body:
                     return None
-            kwargs[pname] = value
-            
-        # special arguments
-        if self.request_param is not None:
-            kwargs[self.request_param] = request
-        if self.bytes_body_param is not None:
-            kwargs[self.bytes_body_param] = request.body
-        if self.json_body_param is not None:
-            doc = JSON(request.body)
-            if doc.value() is None:
-                return None
-            else:
-                kwargs[self.json_body_param] = doc
-        if self.json_dict_body_param is not None:
-            doc = DictJSON(request.body)
-            if doc.value() is None:
-                return None
-            else:
-                kwargs[self.json_dict_body_param] = doc
-        if self.path_param is not None:
-            kwargs[self.path_param] = copy.deepcopy(request.path)
-        if self.query_param is not None:
-            kwargs[self.query_param] = copy.deepcopy(request.query)
+                # the body is parsed at most once per request, however many handlers want it
+                doc = request._json_cache.get(converter, None)
+                if doc is None:
+                    doc = converter(request.body)   # converter is JSON or DictJSON
+                    request._json_cache[converter] = doc
+                if doc.value() is None:
+                    return None
+                kwargs[pname] = doc
+            elif tag == _TAG_PATH:
+                kwargs[pname] = request.path[:]
+            elif tag == _TAG_QUERY:
+                kwargs[pname] = dict(request.query)
 
         return kwargs
     
 
 
-def get(path_rule:str, status_code:int=200):
+def get(path_rule:str, status_code:int=200, terminal:bool=False):
     """decorator to make a GET-request handler (method of a subclass of App)
     Args:
       - path_rule: path pattern to match
       - status_code: default status code for success
+      - terminal: if True, a response from this handler stops the handler/sub-app chain
     """
     def wrapper(func):
         if not hasattr(func, 'slowapi_path_rule'):
-            func.slowapi_path_rule = PathRule(path_rule, 'GET', inspect.signature(func), status_code=status_code)
+            func.slowapi_path_rule = PathRule(path_rule, 'GET', _signature_of(func), status_code=status_code, terminal=terminal)
         return func
     return wrapper
 
 
-def post(path_rule:str, status_code:int=201):
+def post(path_rule:str, status_code:int=201, terminal:bool=False):
     """decorator to make a POST-request handler (method of a subclass of App)
     Args:
       - path_rule: path pattern to match
       - status_code: default status code for success
+      - terminal: if True, a response from this handler stops the handler/sub-app chain
     """
     def wrapper(func):
         if not hasattr(func, 'slowapi_path_rule'):
-            func.slowapi_path_rule = PathRule(path_rule, 'POST', inspect.signature(func), status_code=status_code)
+            func.slowapi_path_rule = PathRule(path_rule, 'POST', _signature_of(func), status_code=status_code, terminal=terminal)
         return func
     return wrapper
 
 
-def delete(path_rule:str, status_code:int=200):
+def delete(path_rule:str, status_code:int=200, terminal:bool=False):
     """decorator to make a DELETE-request handler (method of a subclass of App)
     Args:
       - path_rule: path pattern to match
       - status_code: default status code for success
+      - terminal: if True, a response from this handler stops the handler/sub-app chain
     """
     def wrapper(func):
         if not hasattr(func, 'slowapi_path_rule'):
-            func.slowapi_path_rule = PathRule(path_rule, 'DELETE', inspect.signature(func), status_code=status_code)
+            func.slowapi_path_rule = PathRule(path_rule, 'DELETE', _signature_of(func), status_code=status_code, terminal=terminal)
         return func
     return wrapper
 
     
-def route(path_rule:str, status_code:int=200):
+def route(path_rule:str, status_code:int=200, terminal:bool=False):
     """decorator to make a request handler (method of a subclass of App) for all request methods
     Args:
       - path_rule: path pattern to match
       - status_code: default status code for success
+      - terminal: if True, a response from this handler stops the handler/sub-app chain
     """
     def wrapper(func):
         if not hasattr(func, 'slowapi_path_rule'):
-            func.slowapi_path_rule = PathRule(path_rule, '*', inspect.signature(func), status_code=status_code)
+            func.slowapi_path_rule = PathRule(path_rule, '*', _signature_of(func), status_code=status_code, terminal=terminal)
         return func
     return wrapper
 
@@ -203,7 +313,7 @@ def websocket(path_rule:str):
     """
     def wrapper(func):
         if not hasattr(func, 'slowapi_path_rule'):
-            func.slowapi_path_rule = PathRule(path_rule, 'websocket', inspect.signature(func))
+            func.slowapi_path_rule = PathRule(path_rule, 'websocket', _signature_of(func))
         return func
     return wrapper
 
@@ -216,14 +326,142 @@ class Router:
         self.subapps = []
         self.middlewares = []
 
+        # segment trie over the handler path rules; built lazily on first dispatch
+        self._route_trie = None
+        self._route_trie_size = 0
+
+        # first-cut filter keyed by (method, first path segment); built lazily like the trie
+        self._dispatch_index = None
+        self._dispatch_index_size = 0
+
         # Binding URL handlers to the PathRule attached by decorators (@get(PATH) etc).
         # Note that __init__() is called after all the decorators.
-        for name, method in inspect.getmembers(type(self.app), predicate=inspect.isfunction):
-            if hasattr(method, 'slowapi_path_rule'):
-                logging.debug(f'SlowAPI Binding: {method.slowapi_path_rule.method} {method.slowapi_path_rule.rule_str} -> {self.app.__class__.__name__}.{name}{inspect.signature(method)}')
-                self.handlers.append(method)
+        # The inspect.getmembers() walk is done once per class and cached on the class;
+        # the "in cls.__dict__" guard keeps a subclass from reusing its parent's cache.
+        cls = type(self.app)
+        if '_slowapi_handlers_cache' not in cls.__dict__:
+            handlers = []
+            for name, method in inspect.getmembers(cls, predicate=inspect.isfunction):
+                if hasattr(method, 'slowapi_path_rule'):
+                    logging.debug(f'SlowAPI Binding: {method.slowapi_path_rule.method} {method.slowapi_path_rule.rule_str} -> {self.app.__class__.__name__}.{name}{inspect.signature(method)}')
+                    handlers.append(method)
+            cls._slowapi_handlers_cache = handlers
+        self.handlers.extend(cls._slowapi_handlers_cache)
+
+
+    @staticmethod
+    def _make_trie_node():
+        # 'static': {segment: child}, 'wild': child for a "{param}" segment,
+        # 'handlers': {METHOD: [(order, handler),...]} for rules terminating here,
+        # 'extra': {METHOD: [(order, handler),...]} for "{*}" rules rooted here
+        return { 'static': {}, 'wild': None, 'handlers': {}, 'extra': {} }
+
+
+    def _build_route_trie(self):
+        """builds a trie keyed by URL path segments, so that dispatch walks the
+           request path once instead of testing every handler's PathRule
+        """
+        trie = self._make_trie_node()
+        for order, handler in enumerate(self.handlers):
+            rule = handler.slowapi_path_rule
+            node = trie
+            nodes_at_depth = [ node ]   # node after consuming k segments, for k = 0 .. len(rule.path)
+            for elem in rule.path:
+                if elem is None:   # path parameter
+                    if node['wild'] is None:
+                        node['wild'] = self._make_trie_node()
+                    node = node['wild']
+                else:
+                    node = node['static'].setdefault(elem, self._make_trie_node())
+                nodes_at_depth.append(node)
+
+            if rule.take_extra_path:
+                node['extra'].setdefault(rule.method, []).append((order, handler))
+            else:
+                node['handlers'].setdefault(rule.method, []).append((order, handler))
+
+            # a shorter request path is allowed when all the omitted tail segments are parameters
+            # (they might have default values); register the rule at those depths as well
+            for depth in range(len(rule.path)-1, -1, -1):
+                if rule.path[depth] is not None:
+                    break
+                nodes_at_depth[depth]['handlers'].setdefault(rule.method, []).append((order, handler))
+
+        return trie
+
+
+    def _find_handlers(self, request:Request):
+        """walks the route trie and returns the handlers whose PathRule can match the request,
+           in handler registration order
+        """
+        if (self._route_trie is None) or (self._route_trie_size != len(self.handlers)):
+            self._route_trie = self._build_route_trie()
+            self._route_trie_size = len(self.handlers)
+
+        def collect(method_table, found):
+            found.extend(method_table.get(request.method, ()))
+            if request.method != 'WEBSOCKET':
+                found.extend(method_table.get('*', ()))
+
+        found = []
+        nodes = [ self._route_trie ]
+        for elem in request.path:
+            next_nodes = []
+            for node in nodes:
+                collect(node['extra'], found)   # "{*}" rules take any deeper path
+                child = node['static'].get(elem, None)
+                if child is not None:
+                    next_nodes.append(child)
+                if node['wild'] is not None:
+                    next_nodes.append(node['wild'])
+            if len(next_nodes) == 0:
+                nodes = []
+                break
+            nodes = next_nodes
+
+        for node in nodes:
+            collect(node['handlers'], found)
+            collect(node['extra'], found)   # "{*}" also matches with an empty extra path
+
+        found.sort()
+        return [ handler for order, handler in found ]
+
+
+    def _build_dispatch_index(self):
+        """builds a dict keyed by (method, first path segment), so that a single lookup
+           replaces the per-handler method/segment comparisons
+        """
+        index = {}
+        for order, handler in enumerate(self.handlers):
+            rule = handler.slowapi_path_rule
+            if rule.path_len == 0:
+                first = '*' if rule.take_extra_path else ''
+            else:
+                first = rule.path[0] if rule.path[0] is not None else '*'
+            index.setdefault((rule.method, first), []).append((order, handler))
+        return index
+
+
+    def _find_candidates(self, request:Request):
+        """returns the handlers whose method and leading path segment can match the request,
+           in handler registration order; a cheap first-cut before PathRule.match()
+        """
+        if (self._dispatch_index is None) or (self._dispatch_index_size != len(self.handlers)):
+            self._dispatch_index = self._build_dispatch_index()
+            self._dispatch_index_size = len(self.handlers)
+
+        first = request.path[0] if len(request.path) > 0 else ''
+        found = []
+        found.extend(self._dispatch_index.get((request.method, first), ()))
+        found.extend(self._dispatch_index.get((request.method, '*'), ()))
+        if request.method != 'WEBSOCKET':
+            found.extend(self._dispatch_index.get(('*', first), ()))
+            found.extend(self._dispatch_index.get(('*', '*'), ()))
+
+        found.sort()
+        return [ handler for order, handler in found ]
+
 
-        
     async def dispatch(self, request:Request, body:bytes=None) -> Response:
         if type(request) is str:
             if body is None:
@@ -232,10 +470,14 @@ class Router:
                 request = Request(request, method='POST', body=body)
 
         # execute handlers from top to bottom, and store the responses in a list
-        response_list = [ Response() ]
+        # a "terminal" response stops the chain: remaining handlers/sub-apps are skipped
+        response_list = [ get_pooled_response() ]
         for subapp in self.middlewares:
-            response_list.append(await subapp.slowapi.dispatch(request))
-        for handler in self.handlers:
+            response = await subapp.slowapi.dispatch(request)
+            if response.terminal:
+                return self.merge_terminal_response(response_list, response)
+            response_list.append(response)
+        for handler in self._find_handlers(request):
             args = handler.slowapi_path_rule.match(request)
             if args is not None:
                 if inspect.iscoroutinefunction(handler):
@@ -248,10 +490,17 @@ class Router:
                 if not isinstance(response, Response):
                     status_code = handler.slowapi_path_rule.status_code
                     response = Response(status_code, content=response)
+                if handler.slowapi_path_rule.terminal:
+                    response.terminal = True
                 logging.debug(f'{self.app.__class__.__name__}: {str(request)[:100]} -> Status {response.get_status_code()}: {str(response)[:100]}')
+                if response.terminal:
+                    return self.merge_terminal_response(response_list, response)
                 response_list.append(response)
         for subapp in self.subapps:
-            response_list.append(await subapp.slowapi.dispatch(request))
+            response = await subapp.slowapi.dispatch(request)
+            if response.terminal:
+                return self.merge_terminal_response(response_list, response)
+            response_list.append(response)
 
         return self.merge_responses(response_list)
             
@@ -270,6 +519,31 @@ class Router:
         return response_list[0]
 
 
+    def merge_terminal_response(self, response_list, response):
+        """merges a terminal response into what was collected before it, keeping the
+           terminal object itself (possibly a StreamingResponse subclass) intact when
+           nothing substantive was collected yet
+        """
+        merged = self.merge_responses(response_list)
+        if (merged.status_code == 0) and (merged.content is None) and (len(merged.headers) == 0):
+            return response
+
+        if isinstance(response, StreamingResponse):
+            # merging cannot carry a chunk iterator: drain it into a buffered response,
+            # giving up the streaming but not the content
+            logging.warning('SlowAPI: streaming response merged with earlier responses; content buffered, streaming is lost')
+            buffered = Response(
+                response.get_status_code(),
+                content_type=response.content_type, content=response.get_content()
+            )
+            buffered.headers = response.headers
+            buffered.terminal = True
+            response = buffered
+
+        merged.merge_response(response)
+        return merged
+
+
     def include(self, app):
         if not hasattr(app, 'slowapi'):
             # in case the __init__() method is not called by user subclass
@@ -286,7 +560,7 @@ class Router:
 
     async def websocket(self, request:Request, websocket:WebSocket) -> None:
         logging.info(f"WEBSOCKET: {request}")
-        for handler in self.handlers:
+        for handler in self._find_candidates(request):
             args = handler.slowapi_path_rule.match(request)
             if args is None:
                 continue
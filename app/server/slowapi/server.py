@@ -6,6 +6,7 @@ from wsgiref.util import request_uri
 from wsgiref.simple_server import make_server, WSGIRequestHandler
 
 from .request import Request
+from .response import StreamingResponse, release_pooled_response
 from .websocket import WebSocket
 from .router import Router
 
@@ -61,10 +62,23 @@ async def dispatch_asgi(app, scope, receive, send):
         'status': response.get_status_code(),
         'headers': [(k.encode(),v.encode()) for k,v in response.get_headers() ]
     })
-    await send({
-        'type': 'http.response.body',
-        'body': response.get_content()
-    })
+    if isinstance(response, StreamingResponse):
+        for chunk in response.get_chunks():
+            await send({
+                'type': 'http.response.body',
+                'body': chunk,
+                'more_body': True
+            })
+        await send({
+            'type': 'http.response.body',
+            'body': b''
+        })
+    else:
+        await send({
+            'type': 'http.response.body',
+            'body': response.get_content()
+        })
+        release_pooled_response(response)
 
     
 
@@ -73,12 +87,12 @@ def dispatch_wsgi(app, environ, start_response):
     Args: see the WSGI specification
     """
     
-    # URL without application basepath (different from request_uri(environ))
-    url = environ.get('PATH_INFO', '/')
+    # URL path without application basepath (different from request_uri(environ));
+    # PATH_INFO and QUERY_STRING are passed to Request separately so that no URL
+    # is reconstructed just to be parsed again
+    path = environ.get('PATH_INFO', '/')
     query = environ.get('QUERY_STRING', '')
-    if len(query) > 0:
-        url += '?' + query
-    
+
     method = environ.get('REQUEST_METHOD', 'GET').upper()
 
     headers = {
@@ -113,11 +127,15 @@ def dispatch_wsgi(app, environ, start_response):
         else:
             body = b''
 
-    response = asyncio.run(app.slowapi(Request(url, method=method, headers=headers, body=body)))
-    logging.info(f'{method}: {url} -> {response.status_code}')
+    response = asyncio.run(app.slowapi(Request.from_wsgi(path, query, method, headers=headers, body=body)))
+    logging.info(f'{method}: {path} -> {response.status_code}')
     
     start_response(response.get_status(), response.get_headers())
-    return [ response.get_content() ]
+    if isinstance(response, StreamingResponse):
+        return response.get_chunks()
+    content = response.get_content()
+    release_pooled_response(response)
+    return [ content ]
 
 
 
@@ -58,6 +58,26 @@ class MyApp:
         return { "decimal": decimal.Decimal(num)/decimal.Decimal(den), "float": num/den }
 
 
+    @slowapi.get('/stream')   # overlapping handler; returning None is the "no data" idiom
+    def empty_stream(self):
+        return None
+
+
+    @slowapi.get('/stream')   # chunked response; the content must survive the merge with empty_stream's response
+    def stream(self):
+        return slowapi.StreamingResponse(iter([b'one,two', b'\nthree,four']), content_type='text/csv')
+
+
+    @slowapi.get('/final', terminal=True)   # terminal response: the handler chain stops here
+    def final(self):
+        return {'from': 'terminal handler'}
+
+
+    @slowapi.get('/final')   # never reached: the terminal handler above stops the chain
+    def final_unreached(self):
+        return {'from': 'unreached handler'}
+
+
 app = slowapi.App(MyApp())
 '''
 to run the app as a ASGI server, run:
@@ -84,6 +104,8 @@ async def main():
     #print(await app.slowapi_get('/source'))
     print(await app.slowapi(slowapi.Request('/trash', method='delete')))
     print(await app.slowapi('/deci?den=3'))
+    print(await app.slowapi('/stream'))  # streamed content, buffered by the merge with the None response
+    print(await app.slowapi('/final'))   # the terminal handler's content only
 
 
     